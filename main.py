@@ -1,7 +1,15 @@
+import re
 import json
+import time
+import random
 import asyncio
+import functools
 import tomllib
+from io import StringIO
 from pathlib import Path
+from dataclasses import dataclass
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
 from typing import Any
 
 from aiomcrcon import Client as RconClient
@@ -21,165 +29,411 @@ from napcat import (
 )
 
 
-def load_config() -> dict[str, Any]:
+# tellraw 消息结构固定，预先拼好单条消息组件的静态片段，只填充昵称与内容
+_TELLRAW_PREFIX = '{"text":"[QQ] ","color":"gold","bold":true},{"text":"'
+_TELLRAW_MID = ': ","color":"aqua"},{"text":"'
+_TELLRAW_SUFFIX = '","color":"white"}'
+# 合并发送时，多条消息之间用换行组件分隔
+TELLRAW_ITEM_SEP = ',{"text":"\\n"},'
+
+# 消息合并参数：最多攒 20 条或等待 50ms 后统一发送
+TELLRAW_BATCH_SIZE = 20
+TELLRAW_FLUSH_INTERVAL = 0.05
+# 原版服务器 RCON 单个请求包的载荷上限为 1446 字节，留出余量
+RCON_MAX_PAYLOAD = 1400
+
+# 查询在线玩家的 RCON 命令
+RCON_LIST_COMMAND = "list"
+# 解析 list 响应: "There are N of a max of M players online: a, b, c"
+_LIST_RE = re.compile(r"online:\s*(.*)$", re.DOTALL)
+_SPLIT_RE = re.compile(r"\s*,\s*")
+
+# NapCat 重连退避参数（秒）
+NAPCAT_BACKOFF_BASE = 1
+NAPCAT_BACKOFF_CAP = 60
+# 指数的上限：2 ** 该值 刚好不小于 CAP / BASE，再增大也只会被 CAP 截断
+NAPCAT_BACKOFF_MAX_ATTEMPT = (NAPCAT_BACKOFF_CAP // NAPCAT_BACKOFF_BASE).bit_length()
+# 连接持续这么久（秒）才算稳定，断开后从最小退避重新开始
+NAPCAT_STABLE_SECONDS = 30
+
+# RCON 重试退避参数（秒）
+RCON_BACKOFF_BASE = 1
+RCON_BACKOFF_CAP = 30
+
+# RCON 连接池大小
+RCON_POOL_SIZE = 3
+
+# RCON 保活：空闲时定期发送廉价命令，避免连接被服务器回收
+RCON_KEEPALIVE_INTERVAL = 30
+RCON_KEEPALIVE_COMMAND = "time query gametime"
+
+# 同时在后台处理的群命令上限
+COMMAND_CONCURRENCY = 8
+
+
+# orjson 随 napcat-sdk 一起安装，缺失时退回标准库
+try:
+    import orjson
+
+    def _json_escape(s: str) -> str:
+        """返回 s 的 JSON 字符串转义结果（不含两侧引号）。"""
+        return orjson.dumps(s).decode()[1:-1]
+except ImportError:
+    def _json_escape(s: str) -> str:
+        """返回 s 的 JSON 字符串转义结果（不含两侧引号）。"""
+        return json.dumps(s, ensure_ascii=False)[1:-1]
+
+# 群里活跃发言的人有限，缓存昵称的转义结果；消息内容长度不定，不做缓存
+_escape_nickname = functools.lru_cache(maxsize=512)(_json_escape)
+
+
+@dataclass(frozen=True, slots=True)
+class BotConfig:
+    target_group: int
+    host: str
+    port: int
+    password: str
+    napcat_url: str
+    napcat_token: str
+
+# 字段名, [tool.bot] 中的键名, 类型, 默认值
+_CONFIG_SCHEMA: tuple[tuple[str, str, type, Any], ...] = (
+    ("target_group", "target_group_id", int, 0),
+    ("host", "mc_server_host", str, "localhost"),
+    ("port", "mc_server_port", int, 25575),
+    ("password", "mc_server_password", str, ""),
+    ("napcat_url", "napcat_url", str, "ws://localhost:3001"),
+    ("napcat_token", "napcat_token", str, ""),
+)
+
+def load_config() -> BotConfig:
     config_path = Path("pyproject.toml")
     if not config_path.exists():
         raise FileNotFoundError("Configuration file 'pyproject.toml' not found.")
     
     with config_path.open("rb") as f:
         data = tomllib.load(f)
-    return data.get("tool", {}).get("bot", {})
+    raw = data.get("tool", {}).get("bot", {})
+    return BotConfig(**{field: type_(raw.get(key, default)) for field, key, type_, default in _CONFIG_SCHEMA})
+
+# 消息段类型 -> 文本渲染函数，按 type(seg) 直接查表
+_SEG_HANDLERS: dict[type, Callable[[Any], str]] = {
+    Text: lambda seg: seg.text,
+    Image: lambda _: "[图片]",
+    At: lambda seg: f"@{seg.name if seg.name is not None else seg.qq} ",
+    Face: lambda _: "[表情]",
+    Reply: lambda _: "[回复]",
+    Forward: lambda _: "[转发]",
+}
 
 def parse__chain(_chain: tuple[Message | UnknownMessageSegment, ...] | str) -> str:
-    text_buffer: list[str] = []
+    # 快速路径：绝大多数聊天消息只有一个纯文本段
+    if len(_chain) == 1 and isinstance(_chain[0], Text):
+        return _chain[0].text
+
+    text_buffer = StringIO()
     
     for seg in _chain:
-        match seg:
-            case Text(text=t):
-                text_buffer.append(t)
-            case Image():
-                text_buffer.append("[图片]")
-            case At(qq=q, name=n):
-                name = n if n is not None else q
-                text_buffer.append(f"@{name} ")
-            case Face():
-                text_buffer.append("[表情]")
-            case Reply():
-                text_buffer.append("[回复]")
-            case Forward():
-                text_buffer.append("[转发]")
-            case _:
-                pass
-
-    return "".join(text_buffer)
+        handler = _SEG_HANDLERS.get(type(seg))
+        if handler is not None:
+            text_buffer.write(handler(seg))
+
+    return text_buffer.getvalue()
+
+# --- 熔断器：MC 服务器宕机时快速失败，避免每条消息都卡在重连上 ---
+BREAKER_MAX_FAILS = 5     # 连续失败计数的上限 N（不是滑动窗口）
+BREAKER_THRESHOLD = 0.5   # 连续失败数 / N 达到该比例即熔断
+BREAKER_COOLDOWN = 10     # 熔断冷却时间 T_cool（秒）
+
+_breaker: dict[str, Any] = {"state": "closed", "fails": 0, "opened_at": 0.0}
+
+def _breaker_allow() -> bool:
+    state = _breaker["state"]
+    if state == "closed":
+        return True
+    if state == "open" and time.monotonic() - _breaker["opened_at"] >= BREAKER_COOLDOWN:
+        # 冷却结束，放行一个半开探测请求
+        _breaker["state"] = "half-open"
+        return True
+    # 仍在冷却中，或已有探测请求在途
+    return False
+
+def _breaker_open() -> None:
+    _breaker["state"] = "open"
+    _breaker["opened_at"] = time.monotonic()
+
+def _breaker_record_success() -> None:
+    _breaker["state"] = "closed"
+    _breaker["fails"] = 0
+
+def _breaker_record_failure(is_probe: bool) -> None:
+    _breaker["fails"] = min(_breaker["fails"] + 1, BREAKER_MAX_FAILS)
+    # 只在进入 open 的那一刻记录时间：已熔断时的迟到失败不顺延冷却，
+    # 半开状态下也只有探测请求本身的失败才能重新熔断
+    state = _breaker["state"]
+    if (is_probe and state == "half-open") or (state == "closed" and _breaker["fails"] / BREAKER_MAX_FAILS >= BREAKER_THRESHOLD):
+        print(f"RCON 连续失败，熔断 {BREAKER_COOLDOWN} 秒")
+        _breaker_open()
+
+# --- RCON 连接池：单个 RCON 会话只能串行请求，多连接避免查询与转发互相阻塞 ---
+RconPool = asyncio.Queue[RconClient]
+
+def create_rcon_pool(clients: list[RconClient]) -> RconPool:
+    pool: RconPool = asyncio.Queue()
+    for client in clients:
+        pool.put_nowait(client)
+    return pool
+
+@asynccontextmanager
+async def _acquire(pool: RconPool) -> AsyncIterator[RconClient]:
+    # 队列里只放空闲连接，取出即独占，用完归还
+    rcon = await pool.get()
+    try:
+        yield rcon
+    finally:
+        pool.put_nowait(rcon)
 
 # --- 核心优化：通用 RCON 执行器 (带重试) ---
-async def execute_rcon_command(rcon: RconClient, command: str, max_retries: int = 1) -> str | None:
+async def execute_rcon_command(pool: RconPool, command: str, max_retries: int = 1) -> str | None:
     """
     执行 RCON 命令，包含自动重连和重试逻辑。
+    熔断期间直接返回 None，不再尝试连接；否则从连接池中取一个空闲连接执行。
     返回: 命令响应文本(str)，如果最终失败则返回 None。
     """
-    for attempt in range(max_retries + 1):
-        try:
-            # 尝试发送
-            res, _ = await rcon.send_cmd(command)
-            return res
-
-        except (ClientNotConnectedError, RCONConnectionError, OSError) as e:
-            # 连接错误，尝试重连
-            print(f"RCON 执行异常: {e}，正在尝试重连...")
-            
-            # 如果是最后一次尝试，就不再重连了，直接抛出或返回
-            if attempt == max_retries:
-                print(f"RCON 命令最终失败: {command}")
-                return None
-
-            # 尝试重新建立连接
-            try:
-                # 某些情况下 close 能清理旧的 broken pipe
-                await rcon.close() 
-                await rcon.connect()
-                print("RCON 重连成功，重试命令...")
-                continue # 进入下一次循环重试 send_cmd
-            except Exception as connect_err:
-                print(f"重连失败: {connect_err}")
-                return None
-        except Exception as e:
-            # 其他逻辑错误（如命令格式错误），不重试
-            print(f"未知错误: {e}")
-            return None
-    return None
+    if not _breaker_allow():
+        return None
+    # 只有被 _breaker_allow 放行的那个调用才是半开探测
+    is_probe = _breaker["state"] == "half-open"
 
-async def query_online_players(rcon: RconClient) -> list[str] | None:
+    try:
+        async with _acquire(pool) as rcon:
+            for attempt in range(max_retries + 1):
+                try:
+                    # 尝试发送
+                    res, _ = await rcon.send_cmd(command)
+                    _breaker_record_success()
+                    return res
+
+                except (ClientNotConnectedError, RCONConnectionError, OSError) as e:
+                    # 连接错误，尝试重连
+                    print(f"RCON 执行异常: {e}，正在尝试重连...")
+                
+                    # 如果是最后一次尝试，就不再重连了，直接抛出或返回
+                    if attempt == max_retries:
+                        print(f"RCON 命令最终失败: {command}")
+                        _breaker_record_failure(is_probe)
+                        return None
+
+                    # 重连前做 full jitter 退避；最后一次失败已在上面返回，不会白等
+                    await asyncio.sleep(random.uniform(0, min(RCON_BACKOFF_CAP, RCON_BACKOFF_BASE * 2 ** attempt)))
+
+                    # 尝试重新建立连接
+                    try:
+                        # 某些情况下 close 能清理旧的 broken pipe
+                        await rcon.close() 
+                        await rcon.connect()
+                        print("RCON 重连成功，重试命令...")
+                        continue # 进入下一次循环重试 send_cmd
+                    except Exception as connect_err:
+                        print(f"重连失败: {connect_err}")
+                        _breaker_record_failure(is_probe)
+                        return None
+                except Exception as e:
+                    # 其他逻辑错误（如命令格式错误），不重试
+                    print(f"未知错误: {e}")
+                    return None
+        return None
+    finally:
+        # 半开探测没有得出结论（逻辑错误或被取消），重新进入冷却，避免卡在半开状态
+        if is_probe and _breaker["state"] == "half-open":
+            _breaker_open()
+
+async def query_online_players(pool: RconPool) -> list[str] | None:
     # 复用 execute_rcon_command，享受重连机制
-    response = await execute_rcon_command(rcon, "list")
+    response = await execute_rcon_command(pool, RCON_LIST_COMMAND)
     
     if response is None:
         return None
 
-    part = response.split("online: ")
-
-    if len(part) != 2:
+    m = _LIST_RE.search(response)
+    if m is None:
         return None
-    
-    players_str = part[1].strip()
-    players = [p.strip() for p in players_str.split(",")] if players_str else []
+
+    players_str = m.group(1).strip()
+    players = _SPLIT_RE.split(players_str) if players_str else []
     return players
 
 
-async def send_to_mc(rcon: RconClient, nickname: str, content: str) -> None:
-    payload: list[dict[str, Any]] = [
-        {"text": "[QQ] ", "color": "gold", "bold": True},
-        {"text": f"{nickname}: ", "color": "aqua"},
-        {"text": content, "color": "white"}
-    ]
-    command = f'tellraw @a {json.dumps(payload)}'
-    
-    # 复用执行器，不需要返回值
-    await execute_rcon_command(rcon, command)
+def _format_component(nickname: str, content: str) -> str:
+    """生成单条消息的 tellraw 组件（不含外层方括号）。"""
+    return "".join((_TELLRAW_PREFIX, _escape_nickname(nickname), _TELLRAW_MID, _json_escape(content), _TELLRAW_SUFFIX))
+
+async def send_to_mc(queue: asyncio.Queue[str], nickname: str, content: str) -> None:
+    # 只负责格式化后入队，由 tellraw_flusher 合并发送
+    await queue.put(_format_component(nickname, content))
+
+def _pack_tellraw(items: list[str]) -> list[str]:
+    """把多条消息组件拼成尽量少的 tellraw 命令，每条命令不超过 RCON 单包上限。"""
+    commands: list[str] = []
+    batch: list[str] = []
+    size = 0
+    for item in items:
+        item_size = len(item.encode()) + len(TELLRAW_ITEM_SEP)
+        if batch and size + item_size > RCON_MAX_PAYLOAD:
+            commands.append("".join(("tellraw @a [", TELLRAW_ITEM_SEP.join(batch), "]")))
+            batch = []
+            size = 0
+        batch.append(item)
+        size += item_size
+    if batch:
+        commands.append("".join(("tellraw @a [", TELLRAW_ITEM_SEP.join(batch), "]")))
+    return commands
+
+async def tellraw_flusher(pool: RconPool, queue: asyncio.Queue[str]) -> None:
+    """从队列中攒批消息，合并为一条 tellraw 发送，减少 RCON 往返次数。"""
+    loop = asyncio.get_running_loop()
+    while True:
+        items = [await queue.get()]
+        deadline = loop.time() + TELLRAW_FLUSH_INTERVAL
+        while len(items) < TELLRAW_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(queue.get(), timeout))
+            except TimeoutError:
+                break
+
+        # 复用执行器，不需要返回值
+        for command in _pack_tellraw(items):
+            await execute_rcon_command(pool, command)
+
+async def rcon_keepalive(pool: RconPool) -> None:
+    """定期在每个连接上执行一次廉价命令，保持 TCP 连接活跃。"""
+    while True:
+        await asyncio.sleep(RCON_KEEPALIVE_INTERVAL)
+        # 连接池按 FIFO 归还，顺序执行 RCON_POOL_SIZE 次即可轮到每个连接
+        # 熔断期间 execute_rcon_command 会直接返回，不会刷屏
+        for _ in range(RCON_POOL_SIZE):
+            await execute_rcon_command(pool, RCON_KEEPALIVE_COMMAND)
+
+# --- 群内命令 ---
+async def cmd_list(event: GroupMessageEvent, pool: RconPool) -> None:
+    players = await query_online_players(pool)
+    if players is None:
+        await event.send_msg("无法获取在线玩家列表，请检查 RCON 连接。")
+    elif not players:
+        await event.send_msg("当前没有在线玩家。")
+    else:
+        player_list = ", ".join(players)
+        await event.send_msg(f"当前在线玩家({len(players)} / 40): {player_list}")
+
+async def cmd_ping(event: GroupMessageEvent, pool: RconPool) -> None:
+    await event.send_msg("Pong! 机器人在线。")
+
+async def cmd_version(event: GroupMessageEvent, pool: RconPool) -> None:
+    await event.send_msg(f"NapCat SDK 版本：{__version__}")
+
+# 命令文本 -> 处理函数，整条消息完全匹配才触发
+_CMD_TABLE: dict[str, Callable[[GroupMessageEvent, RconPool], Awaitable[None]]] = {
+    ".mc": cmd_list,
+    ".list": cmd_list,
+    ".cx": cmd_list,
+    ".ping": cmd_ping,
+    ".version": cmd_version,
+}
+
+async def _run_command(sem: asyncio.Semaphore, coro: Awaitable[None]) -> None:
+    async with sem:
+        try:
+            await coro
+        except Exception as e:
+            print(f"命令处理失败: {e}")
+
+def spawn_command(tasks: set[asyncio.Task[None]], sem: asyncio.Semaphore, coro: Awaitable[None]) -> None:
+    """在后台执行命令，事件循环无需等待 RCON/NapCat 往返即可继续读取下一条事件。"""
+    task = asyncio.create_task(_run_command(sem, coro))
+    # 保留强引用，避免未完成的任务被回收
+    tasks.add(task)
+    task.add_done_callback(tasks.discard)
 
 async def main() -> None:
     config = load_config()
-    target_group = int(config.get("target_group_id", 0))
-    host = str(config.get("mc_server_host", "localhost"))
-    port = int(config.get("mc_server_port", 25575))
-    password = str(config.get("mc_server_password", ""))
+    target_group = config.target_group
+    host = config.host
+    port = config.port
+    password = config.password
     
     if target_group == 0:
         print("错误: 请配置 target_group_id")
         return
 
-    mc_client = RconClient(host, port, password)
+    rcon_clients = [RconClient(host, port, password) for _ in range(RCON_POOL_SIZE)]
+    rcon_pool = create_rcon_pool(rcon_clients)
     
-    # 优化：启动时尝试连接一次
-    try:
-        await mc_client.connect()
-        print("RCON 初始化连接成功")
-    except Exception as e:
-        print(f"RCON 初始化连接失败: {e} (将在发送消息时自动重试)")
+    # 优化：启动时并发尝试连接池中所有连接
+    results = await asyncio.gather(*(c.connect() for c in rcon_clients), return_exceptions=True)
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if not errors:
+        print(f"RCON 初始化连接成功 (连接数: {len(rcon_clients)})")
+    else:
+        print(f"RCON 初始化连接失败: {errors[0]} (将在发送消息时自动重试)")
+
+    tellraw_queue: asyncio.Queue[str] = asyncio.Queue()
+    flusher_task = asyncio.create_task(tellraw_flusher(rcon_pool, tellraw_queue))
+    keepalive_task = asyncio.create_task(rcon_keepalive(rcon_pool))
 
-    napcat_url = str(config.get("napcat_url", "ws://localhost:3001"))
-    napcat_token = str(config.get("napcat_token", ""))
+    # 命令在后台并发处理，信号量限制同时进行的数量
+    command_tasks: set[asyncio.Task[None]] = set()
+    command_sem = asyncio.Semaphore(COMMAND_CONCURRENCY)
+
+    napcat_url = config.napcat_url
+    napcat_token = config.napcat_token
     
     print(f"开始监听 NapCat: {napcat_url}，目标群: {target_group}")
 
+    # 客户端只创建一次，每次迭代时由 SDK 重新建立 websocket 连接
+    napcat_client = NapCatClient(napcat_url, napcat_token)
+
+    loop = asyncio.get_running_loop()
+    attempt = 0
     while True:
+        session_start = loop.time()
         try:
-            async for event in NapCatClient(napcat_url, napcat_token):
-                match event:
-                    case GroupMessageEvent(group_id=gid, sender=sender, message=message) if int(gid) == target_group:
-                        
-                        raw_content = parse__chain(message)
-                        clean_content = raw_content.strip()
-
-                        if clean_content:
-                            display_name = sender.card or sender.nickname or "未知用户"
-                            await send_to_mc(mc_client, display_name, clean_content)
-
-                        match clean_content:
-                            case ".mc":
-                                players = await query_online_players(mc_client)
-                                if players is None:
-                                    await event.send_msg("无法获取在线玩家列表，请检查 RCON 连接。")
-                                elif not players:
-                                    await event.send_msg("当前没有在线玩家。")
-                                else:
-                                    player_list = ", ".join(players)
-                                    await event.send_msg(f"当前在线玩家({len(players)} / 40): {player_list}")
-                            case ".ping":
-                                await event.send_msg("Pong! 机器人在线。")
-                            case ".version":
-                                await event.send_msg(f"NapCat SDK 版本：{__version__}")
-                            case _:
-                                pass
-                    case _:
-                        pass
+            async for event in napcat_client:
+                # 先做廉价的类型和群号过滤，非目标群事件直接跳过
+                if not isinstance(event, GroupMessageEvent) or event.group_id != target_group:
+                    continue
+
+                raw_content = parse__chain(event.message)
+                clean_content = raw_content.strip()
+
+                command = _CMD_TABLE.get(clean_content)
+                if command is not None:
+                    spawn_command(command_tasks, command_sem, command(event, rcon_pool))
+                elif clean_content and not clean_content.startswith("."):
+                    display_name = event.sender.card or event.sender.nickname or "未知用户"
+                    await send_to_mc(tellraw_queue, display_name, clean_content)
+            # websocket 被关闭时 SDK 只是结束迭代，不抛异常
+            reason = "连接已关闭"
         except Exception as e:
-            print(f"NapCat 连接断开: {e}，5秒后重连...")
-            await asyncio.sleep(5)
+            reason = str(e)
+
+        # 连接稳定运行过一段时间才重置退避计数；
+        # 只收到 lifecycle 等元事件就断开的连接仍按失败处理，避免反复秒连
+        if loop.time() - session_start >= NAPCAT_STABLE_SECONDS:
+            attempt = 0
+
+        # full jitter 指数退避，避免 NapCat 重启时所有实例同时重连
+        delay = random.uniform(0, min(NAPCAT_BACKOFF_CAP, NAPCAT_BACKOFF_BASE * 2 ** attempt))
+        attempt = min(attempt + 1, NAPCAT_BACKOFF_MAX_ATTEMPT)
+        print(f"NapCat 连接断开: {reason}，{delay:.1f}秒后重连...")
+        await asyncio.sleep(delay)
 
     # 这里的 close 实际上很难被执行到，除非 break loop
-    await mc_client.close()
+    flusher_task.cancel()
+    keepalive_task.cancel()
+    await asyncio.gather(*(c.close() for c in rcon_clients), return_exceptions=True)
 
 if __name__ == "__main__":
     try: